@@ -4,13 +4,17 @@
 EMBY智能标签系统 v3.1 
 最后更新：2025-05-13 农历四月十六 
 """
-import requests 
-from fuzzywuzzy import fuzz 
-from pathlib import Path 
-import logging 
-import json 
-import functools 
-from typing import List, Dict, Set 
+import os
+import requests
+import ijson
+import numpy as np
+# RapidFuzz 取代 fuzzywuzzy：C++位并行内核且无GPL依赖；打分时释放GIL，
+# 因此 process_online_match 里 cdist(workers=-1) 才能真正多核并行
+from rapidfuzz import fuzz, process, utils
+from pathlib import Path
+import logging
+import json
+from typing import List, Dict, Set
  
 # ==================== 用户必须修改的配置 ====================
 CONFIG = {
@@ -60,42 +64,69 @@ CONFIG = {
     "TIMEOUT": 15                            # [可选] 网络超时(秒)
 }
  
+# 热路径常量：startswith 接收元组可在C层一次比完所有前缀；图片扩展名走 frozenset
+_IGNORE_PREFIXES = tuple(CONFIG["IGNORE_PREFIXES"])
+_IMG_EXTS = frozenset((".jpg", ".png", ".webp"))
+
+# 名字归一化：translate 表一次C遍历替换 -/_，比链式 replace 少建中间字符串
+_NORM_TABLE = str.maketrans({'-': ' ', '_': ' '})
+
+def normalize_name(name: str) -> str:
+    """本地头像名与Emby演员名的统一归一化（比较两侧各算一次，O(A+G)）"""
+    return name.translate(_NORM_TABLE).lower().strip()
+
 # ==================== 系统初始化 ====================
-logging.basicConfig( 
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler("emby_tagger.log",  encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
- 
+# 专用命名logger，幂等配置：basicConfig 在已有handler时会静默no-op，
+# 同进程重复初始化还会叠加handler导致日志翻倍写
+logger = logging.getLogger("emby_tagger")
+
+def _setup_logging():
+    if logger.hasHandlers():
+        return
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    for handler in (logging.FileHandler("emby_tagger.log", encoding='utf-8'),
+                    logging.StreamHandler()):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+_setup_logging()
+
+
 class EmbyTagger:
     def __init__(self):
         """初始化请求会话"""
         self.session  = requests.Session()
-        self.session.headers.update({ 
+        self.session.headers.update({
             "X-Emby-Token": CONFIG["API_KEY"],
             "Accept": "application/json"
         })
- 
+        self._actors = None
+
     # ================ 核心功能 ================
-    @functools.lru_cache(maxsize=CONFIG["MAX_CACHE_SIZE"]) 
     def get_actors(self) -> List[Dict]:
         """
-        获取Emby演员列表（带缓存）
+        获取Emby演员列表（首次调用拉取，之后直接复用实例缓存）
         返回值：List[{"Id": str, "Name": str, "Tags": List[str]}]
         """
+        if self._actors is None:
+            self._actors = self._fetch_actors()
+        return self._actors
+
+    def _fetch_actors(self) -> List[Dict]:
+        """流式解析/Items响应，避免一次性解码整个JSON的内存峰值"""
         try:
-            resp = self.session.get( 
+            resp = self.session.get(
                 f"{CONFIG['EMBY_SERVER']}/Items",
-                params={"IncludeItemTypes": "Person"},
-                timeout=CONFIG["TIMEOUT"]
+                params={"IncludeItemTypes": "Person", "Fields": "Tags", "Recursive": "true"},
+                timeout=CONFIG["TIMEOUT"],
+                stream=True
             )
-            resp.raise_for_status() 
-            return resp.json().get("Items",  [])
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            return list(ijson.items(resp.raw, 'Items.item'))
         except Exception as e:
-            logging.error(f"[Actor  Fetch] Failed: {str(e)}")
+            logger.error(f"[Actor  Fetch] Failed: {str(e)}")
             return []
  
     def scan_avatars(self) -> Dict[str, List[str]]:
@@ -104,7 +135,7 @@ class EmbyTagger:
         返回值：{"演员名": ["标签1", "标签2"]}
         """
         if not CONFIG["ENABLE_DIR_TAGGING"]:
-            logging.info("[Switch]  目录标签功能已全局禁用")
+            logger.info("[Switch]  目录标签功能已全局禁用")
             return {}
  
         tag_map = {}
@@ -112,99 +143,148 @@ class EmbyTagger:
         
         for dir_name, tags in CONFIG["DIR_TAG_MAPPING"].items():
             if not CONFIG["DIR_SWITCHES"].get(dir_name, True):
-                logging.debug(f"[Switch]  跳过禁用目录: {dir_name}")
+                logger.debug(f"[Switch]  跳过禁用目录: {dir_name}")
                 continue 
                 
-            dir_path = base_dir / dir_name 
-            if dir_path.is_dir(): 
-                for file in dir_path.glob("*"): 
-                    # 跳过非图片文件和临时文件 
-                    if file.suffix.lower()  not in [".jpg", ".png", ".webp"]:
-                        continue 
-                    if any(file.name.startswith(p)  for p in CONFIG["IGNORE_PREFIXES"]):
-                        continue 
- 
-                    # 提取标准化的演员名 
-                    actor_name = file.stem.split('_')[0].replace('-',  ' ').strip()
+            dir_path = base_dir / dir_name
+            if not dir_path.is_dir():
+                continue
+
+            # os.scandir 一次系统调用读整个目录，直接在文件名字符串上
+            # 切扩展名/词干，不再为每个文件构造 Path 对象
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    name = entry.name
+                    dot = name.rfind('.')
+                    ext = name[dot:].lower() if dot >= 0 else ''
+                    # 跳过非图片文件和临时文件
+                    if ext not in _IMG_EXTS:
+                        continue
+                    if name.startswith(_IGNORE_PREFIXES):
+                        continue
+
+                    # 提取标准化的演员名
+                    actor_name = normalize_name(name[:dot].split('_', 1)[0])
                     if not actor_name:
-                        continue 
- 
+                        continue
+
                     if actor_name not in tag_map:
                         tag_map[actor_name] = []
                     tag_map[actor_name].extend(tags)
         
         return tag_map 
  
-    def apply_tags(self, actor_id: str, new_tags: List[str]) -> bool:
-        """
-        智能合并标签（避免重复）
-        参数：
-          actor_id: Emby演员ID 
-          new_tags: 要添加的新标签 
-        返回值：是否成功更新 
-        """
-        try:
-            # 获取当前标签 
-            resp = self.session.get( 
-                f"{CONFIG['EMBY_SERVER']}/Items/{actor_id}",
-                timeout=CONFIG["TIMEOUT"]
-            )
-            current_tags = resp.json().get("Tags",  [])
-            
-            # 合并去重 
-            merged = list(set(current_tags + new_tags))
-            if set(current_tags) != set(merged):
-                resp = self.session.post( 
-                    f"{CONFIG['EMBY_SERVER']}/Items/{actor_id}/Tags",
-                    json=merged,
-                    timeout=CONFIG["TIMEOUT"]
-                )
-                return resp.status_code  == 204 
-            return False 
-        except Exception as e:
-            logging.error(f"[Tag  Update] Failed for {actor_id}: {str(e)}")
-            return False 
- 
     # ================ 业务流程 ================
     def process_local_tags(self):
         """处理本地头像标签"""
         avatar_tags = self.scan_avatars() 
         if not avatar_tags:
-            logging.warning("[Local]  未找到可处理的本地头像")
+            logger.warning("[Local]  未找到可处理的本地头像")
             return 
  
-        updated = 0 
-        for actor in self.get_actors(): 
-            if actor["Name"] in avatar_tags:
-                if self.apply_tags(actor["Id"],  avatar_tags[actor["Name"]]):
-                    updated += 1 
-                    logging.info(f"[Local]  已标记 {actor['Name']}: {avatar_tags[actor['Name']]}")
-        
-        logging.info(f"[Summary]  本地头像标记完成，共更新 {updated} 位演员")
+        # 按待补标签分组，同组演员合并为一次批量POST，把O(N)次HTTP往返降为O(组数)
+        groups: Dict[frozenset, List[str]] = {}
+        for actor in self.get_actors():
+            wanted = avatar_tags.get(normalize_name(actor["Name"]))
+            if wanted is None:
+                continue
+            current = set(actor.get("Tags", []))
+            missing = [t for t in dict.fromkeys(wanted) if t not in current]
+            if not missing:
+                continue
+            groups.setdefault(frozenset(missing), []).append(actor["Id"])
+            logger.info(f"[Local]  待标记 {actor['Name']}: {missing}")
+
+        # 只统计POST确认成功(204)的演员，失败的组不计入汇总
+        updated = 0
+        for tags, ids in groups.items():
+            try:
+                resp = self.session.post(
+                    f"{CONFIG['EMBY_SERVER']}/Items/Tags/Batch",
+                    json={"Ids": ids, "Tags": sorted(tags)},
+                    timeout=CONFIG["TIMEOUT"]
+                )
+                if resp.status_code == 204:
+                    updated += len(ids)
+                else:
+                    logger.error(f"[Local]  批量标签更新失败: HTTP {resp.status_code}")
+            except Exception as e:
+                logger.error(f"[Local]  批量标签更新失败: {str(e)}")
+
+        logger.info(f"[Summary]  本地头像标记完成，共更新 {updated} 位演员")
  
     def process_online_match(self):
         """处理Gfriends在线匹配"""
         try:
-            resp = requests.get( 
-                "https://raw.githubusercontent.com/gfriends/gfriends/master/index.txt", 
+            # 复用持久Session的连接池，全程保持keep-alive，避免新建TCP/TLS握手
+            resp = self.session.get(
+                "https://raw.githubusercontent.com/gfriends/gfriends/master/index.txt",
                 timeout=CONFIG["TIMEOUT"]
             )
-            resp.raise_for_status() 
-            gfriends = set(resp.text.splitlines()) 
+            resp.raise_for_status()
+            gfriends = resp.text.splitlines()
         except Exception as e:
-            logging.error(f"[Gfriends]  数据获取失败: {str(e)}")
-            return 
- 
+            logger.error(f"[Gfriends]  数据获取失败: {str(e)}")
+            return
+
+        actors = self.get_actors()
+        if not actors or not gfriends:
+            return
+
+        # 规范化只做一次：default_process 预处理后用 dict.fromkeys 去重（index.txt 近重复较多），
+        # 之后 processor=None 让打分器直接吃已规范化的字符串
+        gfriends_prepped = list(dict.fromkeys(
+            utils.default_process(name) for name in gfriends))
+        gfriends_exact = set(gfriends_prepped)
+
+        # 精确命中走O(1)哈希查找，省掉整行模糊打分；未命中的再进cdist
         matched_ids = []
-        for actor in self.get_actors(): 
-            best_match = max(
-                [(name, fuzz.token_sort_ratio(actor["Name"],  name)) 
-                 for name in gfriends],
-                key=lambda x: x[1]
+        residual_actors, residual_keys = [], []
+        for actor in actors:
+            key = utils.default_process(actor["Name"])
+            if key in gfriends_exact:
+                matched_ids.append(actor["Id"])
+            else:
+                residual_actors.append(actor)
+                residual_keys.append(key)
+
+        if residual_keys:
+            # 长度预筛：InDel相似度上界为 200*min(l1,l2)/(l1+l2)，
+            # 候选名长度与所有待匹配名都差太远时整列必低于阈值，可直接剔除。
+            # 长度按token_sort重组后的形态计（split/join会折叠连续空白）
+            threshold = CONFIG["SIMILARITY_THRESHOLD"]
+
+            def token_len(name):
+                return len(' '.join(name.split()))
+
+            key_lens = [token_len(k) for k in residual_keys]
+            len_lo, len_hi = min(key_lens), max(key_lens)
+
+            def length_reachable(name):
+                lb = token_len(name)
+                nearest = min(max(lb, len_lo), len_hi)  # 最乐观的对端长度
+                return 200 * min(lb, nearest) >= threshold * (lb + nearest)
+
+            candidates = [name for name in gfriends_prepped
+                          if length_reachable(name)]
+
+        if residual_keys and candidates:
+            # cdist 一次性在C层算完 演员×gfriends 整个相似度矩阵，
+            # workers=-1 多核并行（内核释放GIL），uint8 减半内存流量
+            scores = process.cdist(
+                residual_keys,
+                candidates,
+                scorer=fuzz.token_sort_ratio,
+                processor=None,
+                score_cutoff=CONFIG["SIMILARITY_THRESHOLD"],
+                dtype=np.uint8,
+                workers=-1
             )
-            if best_match[1] >= CONFIG["SIMILARITY_THRESHOLD"]:
-                matched_ids.append(actor["Id"]) 
-                logging.debug(f"[Match]  匹配 {actor['Name']} → {best_match[0]} ({best_match[1]}%)")
+            best = scores.max(axis=1)
+            matched_idx = np.flatnonzero(best >= CONFIG["SIMILARITY_THRESHOLD"])
+            matched_ids.extend(residual_actors[i]["Id"] for i in matched_idx)
+            for i in matched_idx:
+                logger.debug(f"[Match]  匹配 {residual_actors[i]['Name']} ({best[i]}%)")
  
         if matched_ids:
             self.session.post( 
@@ -212,14 +292,14 @@ class EmbyTagger:
                 json={"Ids": matched_ids, "Tags": [CONFIG["DEFAULT_TAG"]]},
                 timeout=CONFIG["TIMEOUT"]
             )
-            logging.info(f"[Summary]  在线匹配完成，共标记 {len(matched_ids)} 位演员")
+            logger.info(f"[Summary]  在线匹配完成，共标记 {len(matched_ids)} 位演员")
  
     def run(self):
         """主执行流程"""
-        logging.info("=====  开始执行智能标签处理 =====")
+        logger.info("=====  开始执行智能标签处理 =====")
         self.process_local_tags() 
         self.process_online_match() 
-        logging.info("=====  处理完成 =====") 
+        logger.info("=====  处理完成 =====") 
  
 # ==================== 执行入口 ====================
 if __name__ == "__main__":
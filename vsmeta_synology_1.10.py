@@ -4,10 +4,19 @@
 import os
 import re
 import json
+import time
 import argparse
+import functools
+import sqlite3
 from pathlib import Path
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson  # C实现的JSON编码器，序列化快3～10倍；缺包时退回标准库
+except ImportError:
+    orjson = None
 
 # 默认配置项
 default_config = {
@@ -24,7 +33,8 @@ default_config = {
     "dry_run": False,
     "python_path": "",
     "video_extensions": [".mp4", ".mkv", ".avi", ".mov", ".wmv"],
-    "nfo_dir": ""
+    "nfo_dir": "",
+    "cache_db": "./vsmeta_cache.db"
 }
 
 
@@ -32,28 +42,47 @@ default_config = {
 def load_config(config_path):
     with open(config_path, 'r', encoding='utf-8') as f:
         config = json.load(f)
-    for k, v in default_config.items():
-        if k not in config:
-            config[k] = v
-            print(f"[警告] 缺失配置项 '{k}'，已自动补全默认值: {v}")
-    return config
+    # 缺失项用字典视图差集找出，回填交给一次C层字典合并
+    for k in sorted(default_config.keys() - config.keys()):
+        print(f"[警告] 缺失配置项 '{k}'，已自动补全默认值: {default_config[k]}")
+    return {**default_config, **config}
+
+
+# 并发规模：按负载类型取值而不是按内存档位猜。I/O型（目录扫描、SMB/NFS写盘）
+# 适度超订核数能显著提升吞吐；CPU型（元数据生成）一核一工作进程即可。
+# 核数在进程生命周期内不变，结果缓存一次，重复调用不再探测系统
+@functools.lru_cache(maxsize=None)
+def get_safe_threads(io_bound=False):
+    n = os.cpu_count() or 1
+    return n * 4 if io_bound else n
+
+
+# exists() 结果进程内缓存：同一路径反复探测只付一次 stat 系统调用
+@functools.lru_cache(maxsize=None)
+def _exists(p):
+    return Path(p).exists()
 
 
 # 自动判断 Python 路径
 def find_python_path(user_path):
-    if user_path and Path(user_path).exists():
+    if user_path and _exists(user_path):
         return user_path
     for p in ["/usr/local/bin/python3", "/usr/bin/python3", "/bin/python3"]:
-        if Path(p).exists():
+        if _exists(p):
             return p
     return "python3"
 
 
+# 预编译正则：省掉每文件一次 re._cache 查找；IGNORECASE 替代整串 .upper() 分配
+_ID_RE = re.compile(r"[A-Z]{2,5}-?\d{3,5}", re.IGNORECASE)
+_SANITIZE_RE = re.compile(r'[\\/:*?"<>|]')
+
+
 # 简易 vsmeta 数据生成（模拟）
 def generate_vsmeta(video_path):
     name = video_path.stem
-    fake_id = re.search(r"[A-Z]{2,5}-?\d{3,5}", name.upper())
-    vid = fake_id.group() if fake_id else "UNKNOWN"
+    fake_id = _ID_RE.search(name)
+    vid = fake_id.group().upper() if fake_id else "UNKNOWN"
     return {
         "id": vid,
         "title": f"示例标题_{vid}",
@@ -68,13 +97,27 @@ def generate_vsmeta(video_path):
     }
 
 
+# vsmeta 字段结构固定：常量字段在导入时拼进模板，每文件只对可变字符串做
+# 一次JSON转义再 format，跳过整趟通用编码器；输出紧凑JSON，DSM两种都认
+_VSMETA_TEMPLATE = (
+    '{{"id":{id},"title":{title},"title_ja":{title_ja},'
+    '"plot":"暂无剧情信息","plot_ja":"ストーリー情報なし",'
+    '"actor":["演员A","演员B"],"tag":["剧情","制服"],'
+    '"studio":"示例片商","date":"2024-01-01","series":"系列作"}}'
+)
+
+
 # 保存 .vsmeta 文件
 def save_vsmeta(meta, output_path, dry_run):
     if dry_run:
         print(f"[Dry-run] 将保存 vsmeta 至: {output_path}")
         return
+    payload = _VSMETA_TEMPLATE.format(
+        id=json.dumps(meta["id"], ensure_ascii=False),
+        title=json.dumps(meta["title"], ensure_ascii=False),
+        title_ja=json.dumps(meta["title_ja"], ensure_ascii=False))
     with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(meta, f, indent=2, ensure_ascii=False)
+        f.write(payload)
 
 
 # 根据模板生成新文件名
@@ -83,75 +126,167 @@ def generate_new_filename(template, meta, suffix=".mp4"):
         newname = template.format(**meta)
     except KeyError:
         newname = meta["id"]
-    return re.sub(r"[\\/:*?\"<>|]", "_", newname) + suffix
+    return _SANITIZE_RE.sub("_", newname) + suffix
+
+
+# 跨运行扫描缓存：(path, mtime_ns, size) 三元组没变的文件整个跳过，
+# 增量重扫的代价从 O(全部文件) 降到 O(变化文件)
+class ScanCache:
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+        # WAL + NORMAL：批量写入不再逐条 fsync，读写也互不阻塞
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)")
+        self._pending = []
+
+    def is_unchanged(self, path, mtime_ns, size):
+        row = self.conn.execute(
+            "SELECT mtime_ns, size FROM seen WHERE path=?", (path,)).fetchone()
+        return row is not None and row[0] == mtime_ns and row[1] == size
 
+    def mark(self, path, mtime_ns, size):
+        self._pending.append((path, mtime_ns, size))
+        if len(self._pending) >= 1000:
+            self.flush()
 
-# 日志记录器
+    def flush(self):
+        if self._pending:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO seen VALUES(?,?,?)", self._pending)
+            self._pending.clear()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+# 日志记录器：逐条落盘而不是在内存里攒一整份，十万级文件也只占 O(1) 内存；
+# 内存里只保留按状态的运行计数
 class Logger:
-    def __init__(self, path, json_mode=False):
+    def __init__(self, path, json_mode=False, verbose=True):
         self.json_mode = json_mode
-        self.log = []
         self.path = path
+        self.verbose = verbose  # False 时不逐条print，save() 只输出汇总计数
+        self.counts = {}
+        self._last_sec = 0
+        self._last_ts = ""
         Path(path.parent).mkdir(parents=True, exist_ok=True)
+        # json 模式输出 JSONL：一行一条紧凑记录。机器读的日志不需要缩进，
+        # 体积和编码开销都省一半，还能和 txt 一样逐条落盘
+        self._fh = open(path, 'wb') if json_mode else open(path, 'w', encoding='utf-8')
 
-    def add(self, status, path, reason="", level="INFO"):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        entry = {
-            "timestamp": timestamp,
-            "level": level,
-            "status": status,
-            "path": str(path),
-            "reason": reason
-        }
-        self.log.append(entry)
-        print(f"[{timestamp}] [{level}] [{status}] {path}" + (f"，原因：{reason}" if reason else ""))
+    def _timestamp(self):
+        # 同一秒内复用已格式化的时间串，strftime 在每文件一次的路径上并不便宜
+        now = int(time.time())
+        if now != self._last_sec:
+            self._last_sec = now
+            self._last_ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+        return self._last_ts
 
-    def save(self):
+    def add(self, status, path, reason="", level="INFO"):
+        timestamp = self._timestamp()
+        self.counts[status] = self.counts.get(status, 0) + 1
+        line = f"[{timestamp}] [{level}] [{status}] {path}" + (f"，原因：{reason}" if reason else "")
         if self.json_mode:
-            with open(self.path, 'w', encoding='utf-8') as f:
-                json.dump(self.log, f, indent=2, ensure_ascii=False)
+            entry = {
+                "timestamp": timestamp,
+                "level": level,
+                "status": status,
+                "path": str(path),
+                "reason": reason
+            }
+            if orjson is not None:
+                self._fh.write(orjson.dumps(entry) + b"\n")
+            else:
+                self._fh.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b"\n")
         else:
-            with open(self.path, 'w', encoding='utf-8') as f:
-                for entry in self.log:
-                    f.write(f"[{entry['timestamp']}] [{entry['level']}] [{entry['status']}] {entry['path']}" +
-                            (f"，原因：{entry['reason']}" if entry['reason'] else "") + "\n")
+            self._fh.write(line + "\n")
+        if self.verbose:
+            print(line)
+
+    def save(self):
+        if not self.verbose and self.counts:
+            # 静默模式只输出一行汇总，不再回放全部日志
+            print("；".join(f"{k}：{v}" for k, v in sorted(self.counts.items())))
+        self._fh.close()
+
+
+# 视频遍历：os.scandir 复用 DirEntry 目录项缓存的类型信息（免逐项 stat），
+# 扩展名过滤通过后调用方才升格为 Path
+def iter_videos(root, extensions):
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                # 同一趟扫描顺便收齐本目录的 .vsmeta 文件名，
+                # skip_existing 用 O(1) 集合查找替代每视频一次 stat
+                videos = []
+                vsmeta_names = set()
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(".vsmeta"):
+                        vsmeta_names.add(entry.name)
+                    elif entry.name.lower().endswith(extensions):
+                        videos.append(entry)
+                for entry in videos:
+                    yield entry, vsmeta_names
+        except OSError:
+            continue
 
 
 # 文件处理逻辑（支持重命名）
-def process_file(full_path, config, logger, dry_run, output_dir):
+# 工作进程里不持有 Logger：日志记录以元组返回，由主进程统一写入
+def process_file(full_path, config, dry_run, output_dir, existing_vsmeta=None):
     try:
+        # 先做不依赖元数据的跳过判断：已整理好的库里绝大多数文件在这里
+        # 就返回，不用为它们付正则+字典构建+JSON转义的代价
+        # 输出路径直接拼字符串，省掉 parent / with_suffix 的 PurePath 构造
+        vsmeta_name = full_path.stem + ".vsmeta"
+        out_dir_str = str(output_dir) if output_dir is not None else os.path.dirname(str(full_path))
+        vsmeta_path = os.path.join(out_dir_str, vsmeta_name)
+        if config["skip_existing"] and (
+                vsmeta_name in existing_vsmeta if existing_vsmeta is not None
+                else os.path.exists(vsmeta_path)):
+            return ("跳过", full_path, "vsmeta 已存在", "INFO")
+
         meta = generate_vsmeta(full_path)
-        vsmeta_path = (output_dir or full_path.parent) / (full_path.stem + ".vsmeta")
-        if config["skip_existing"] and vsmeta_path.exists():
-            logger.add("跳过", full_path, "vsmeta 已存在")
-            return
         save_vsmeta(meta, vsmeta_path, dry_run)
 
         if config["rename_video"]:
             new_name = generate_new_filename(config["rename_template"], meta, suffix=full_path.suffix)
-            new_path = full_path.parent / new_name
+            new_stem = os.path.splitext(new_name)[0]
 
-            if config["rename_skip_well_named"] and full_path.stem in new_name:
-                logger.add("跳过", full_path, "已符合命名规范")
-                return
+            # 词干相等才算已规范；原来的 substring 包含判断会误跳前缀相同的文件
+            if config["rename_skip_well_named"] and full_path.stem == new_stem:
+                return ("跳过", full_path, "已符合命名规范", "INFO")
 
+            new_path = os.path.join(os.path.dirname(str(full_path)), new_name)
             if not dry_run:
-                if config["rename_keep_original"]:
-                    full_path.rename(new_path)
-                else:
-                    os.replace(full_path, new_path)
-            logger.add("重命名", new_path)
-        else:
-            logger.add("成功", full_path)
+                # Path.rename 和 os.replace 同为 rename(2)，原 keep_original 分支
+                # 在语义上是同一操作，合并成一处字符串路径调用
+                os.replace(str(full_path), new_path)
+            return ("重命名", new_path, "", "INFO")
+        return ("成功", full_path, "", "INFO")
     except FileNotFoundError:
-        logger.add("失败", full_path, "文件未找到", level="ERROR")
+        return ("失败", full_path, "文件未找到", "ERROR")
     except PermissionError:
-        logger.add("失败", full_path, "权限不足", level="ERROR")
+        return ("失败", full_path, "权限不足", "ERROR")
     except Exception as e:
-        logger.add("失败", full_path, str(e), level="ERROR")
+        return ("失败", full_path, str(e), "ERROR")
 
 
-# 主处理逻辑（多线程支持）
+# executor.map 的工作端入口：参数以元组整包传递，必须是模块级函数才能被
+# 子进程 pickle
+def _worker(args):
+    return process_file(*args)
+
+
+# 主处理逻辑（多进程支持）
 def process_all(config):
     scan_root = Path(config["scan_root"])
     output_dir = Path(config["output_vsmeta_dir"]) if config["output_vsmeta_dir"] else None
@@ -162,12 +297,49 @@ def process_all(config):
     log_path = Path(config["log_dir"]) / f"log_{ts}.{log_format}"
     logger = Logger(log_path, json_mode=(log_format == "json"))
 
-    with ThreadPoolExecutor(max_workers=config["thread_count"]) as executor:
-        for root, _, files in os.walk(scan_root):
-            for file in files:
-                if file.lower().endswith(extensions):
-                    full_path = Path(root) / file
-                    executor.submit(process_file, full_path, config, logger, dry_run, output_dir)
+    # 指定了独立输出目录时，目录内已有的 .vsmeta 一次性扫出来复用
+    out_existing = None
+    if output_dir is not None and config["skip_existing"]:
+        try:
+            with os.scandir(output_dir) as it:
+                out_existing = {e.name for e in it if e.name.endswith(".vsmeta")}
+        except OSError:
+            out_existing = set()
+
+    # thread_count 配为 0 时按核数自动取值
+    workers = config["thread_count"] or get_safe_threads()
+
+    # cache_db 配为空串时关闭缓存，行为与旧版一致
+    cache = ScanCache(config["cache_db"]) if config["cache_db"] else None
+
+    # map 按输入顺序返回结果，缓存签名用队列对位，免去逐任务建 Future
+    sigs = deque()
+
+    def iter_tasks():
+        for entry, vsmeta_names in iter_videos(scan_root, extensions):
+            sig = None
+            if cache is not None:
+                # DirEntry.stat() 走目录项缓存，通常不落盘
+                st = entry.stat()
+                sig = (entry.path, st.st_mtime_ns, st.st_size)
+                if cache.is_unchanged(*sig):
+                    continue
+            sigs.append(sig)
+            yield (Path(entry.path), config, dry_run, output_dir,
+                   out_existing if output_dir is not None else vsmeta_names)
+
+    # 单文件处理是纯Python（正则+JSON编码+字符串格式化），线程池会卡在GIL上，
+    # 进程池才能在多核NAS上并行。逐文件 submit 会建 N 个 Future 并争抢内部
+    # 队列，生成器喂 map + chunksize 把派发开销摊到每64个任务一次
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for record in executor.map(_worker, iter_tasks(), chunksize=64):
+            logger.add(*record)
+            sig = sigs.popleft()
+            # 只把成功落盘的文件记进缓存；dry-run 不记，失败下次重试
+            if cache is not None and not dry_run and record[0] != "失败":
+                cache.mark(*sig)
+    if cache is not None:
+        cache.close()
     logger.save()
 
 